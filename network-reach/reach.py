@@ -4,21 +4,84 @@ Show AWS network resources in play for a source, and analyze whether
 there any obvious problems for reaching a destination
 """
 import sys
-from pprint import pprint
+from array import array
 import argparse
-import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from itertools import chain
+import json
 import socket
+import struct
 import boto3
+from botocore.config import Config
 
-# CIDR block describing all IPV addresses
-ALL_IPV4 = '0.0.0.0/0'
+# RFC 1918 private IPv4 address blocks
+PRIVATE_IPV4_CIDRS = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16')
+
+@functools.lru_cache(maxsize=4096)
+def ipv4_to_int(ip_address_str):
+    """
+    Convert a dotted-quad IPv4 address to an unsigned 32-bit integer
+
+    Raises ValueError for anything else (e.g., an IPv6 address, octal or hex
+    octets, trailing text), as ipaddress.ip_address() would.
+    """
+    try:
+        packed = socket.inet_aton(ip_address_str)
+    except OSError:
+        packed = None
+    # inet_aton is lenient; only accept input that is already canonical
+    if packed is None or socket.inet_ntoa(packed) != ip_address_str:
+        raise ValueError(f"{ip_address_str!r} does not appear to be an IPv4 address")
+    return struct.unpack('!I', packed)[0]
+
+def as_ipv4_int(ip_address):
+    """
+    Return an IPv4 address as an integer, parsing it if given as a string
+    """
+    if isinstance(ip_address, int):
+        return ip_address
+    return ipv4_to_int(ip_address)
+
+@functools.lru_cache(maxsize=4096)
+def parse_ipv4_cidr(cidr_str):
+    """
+    Parse an IPv4 CIDR block into integers suitable for mask-and-compare matching
+
+    Parameters:
+        cidr_str (string): CIDR block (e.g., 10.92.0.0/16)
+
+    Returns:
+        tuple: (network, mask, prefixlen); an address is in the block when
+        (address & mask) == network
+    """
+    ip_str, sep, prefix_str = cidr_str.partition('/')
+    if sep and not (prefix_str.isdigit() and prefix_str.isascii()):
+        raise ValueError(f"{cidr_str!r} does not have a valid IPv4 prefix length")
+    prefixlen = int(prefix_str) if sep else 32
+    if not 0 <= prefixlen <= 32:
+        raise ValueError(f"{cidr_str!r} does not have a valid IPv4 prefix length")
+    mask = (0xffffffff << (32 - prefixlen)) & 0xffffffff
+    return ipv4_to_int(ip_str) & mask, mask, prefixlen
+
+def is_private_ipv4(ip_address):
+    """
+    Whether an IPv4 address (string or int) falls in one of the RFC 1918 private blocks
+    """
+    ip = as_ipv4_int(ip_address)
+    for cidr in PRIVATE_IPV4_CIDRS:
+        network, mask, _ = parse_ipv4_cidr(cidr)
+        if (ip & mask) == network:
+            return True
+    return False
 
 def get_value_for_tag_key(tags, key):
     """
     Get the value for tag with provided key
 
     Parameters:
-        tags (list of dictionary): list of Key/Value pairs
+        tags (list of dictionary): list of Key/Value pairs, or a dictionary
+            of Key -> Value as built by get_tag_map()
 
             Example tags:
             [{'Key': 'PrincipalId', 'Value': 'AROAJY62KZGVJNG45AAZE:AutoScaling'},
@@ -33,97 +96,275 @@ def get_value_for_tag_key(tags, key):
 
         Example:
     """
+    if isinstance(tags, dict):
+        return tags.get(key, '')
     for item in tags:
         if item.get('Key', '') == key:
             return item.get('Value', '')
     return ''
 
+class CachingClient:
+    """
+    Wrap a boto3 client so that repeated describe_* calls with the same
+    arguments are answered from memory for the rest of the run
+
+    Cached responses are shared between callers, so anything a caller adds
+    to a response (e.g., a compiled index) is seen by later callers too.
+
+    subnet_route_tables and subnet_nacls map a subnet id to the route table
+    and NACL in effect for it, as learned from earlier lookups in the run.
+    """
+    def __init__(self, client):
+        self._client = client
+        self._cache = {}
+        self.subnet_route_tables = {}
+        self.subnet_nacls = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not name.startswith('describe_'):
+            return attr
+
+        def describe(**kwargs):
+            key = (name, json.dumps(kwargs, sort_keys=True, default=str))
+            if key not in self._cache:
+                self._cache[key] = attr(**kwargs)
+            return self._cache[key]
+        return describe
+
+# shared by every client: a connection pool large enough for the concurrent
+# Describe calls, and backoff under API throttling instead of aborting the run
+BOTO_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+)
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """
+    Create the boto3 session on first use and reuse it for every client
+    """
+    return boto3.session.Session()
+
+def make_client(service_name):
+    """
+    Create a describe-caching client for an AWS service from the shared session
+    """
+    return CachingClient(get_session().client(service_name, config=BOTO_CONFIG))
+
+def strip_internal_keys(obj):
+    """
+    Copy a response structure without the '_'-prefixed keys this tool adds
+    (compiled indexes, tag maps)
+    """
+    if isinstance(obj, dict):
+        return {k: strip_internal_keys(v) for k, v in obj.items()
+                if not (isinstance(k, str) and k.startswith('_'))}
+    if isinstance(obj, (list, tuple)):
+        return [strip_internal_keys(v) for v in obj]
+    return obj
+
+def pretty_print(obj):
+    """
+    Print an AWS response structure as indented JSON
+    """
+    print(json.dumps(strip_internal_keys(obj), indent=2, default=str))
+
+def print_verbose(obj, verbose):
+    """
+    Pretty-print an AWS response structure only when verbose output is requested
+    """
+    if verbose:
+        pretty_print(obj)
+
+def get_tag_map(tags):
+    """
+    Build a dictionary of Key -> Value from a list of Key/Value pairs
+    """
+    return {t.get('Key', ''): t.get('Value', '') for t in tags}
+
 def get_subnets(client, subnet_id_list, verbose=False):
     response = client.describe_subnets(
         SubnetIds=subnet_id_list
     )
     if verbose:
         print("Subnets:")
-        pprint(response['Subnets'])
-    assert len(subnet_id_list) == len(response['Subnets'])
-    return response['Subnets']
+        pretty_print(response['Subnets'])
+    subnets = {s['SubnetId']: s for s in response['Subnets']}
+    assert set(subnet_id_list) == subnets.keys()
+    return subnets
 
 def find_subnet_for_ip(client, subnet_id_list, ip_address_str, verbose=False):
+    """
+    Find which of the given subnets contains an IP address
+
+    The subnets are fetched with a single DescribeSubnets call and matched in
+    memory, so the cost does not grow with the number of subnets.
+
+    Parameters:
+        client: boto3 EC2 client
+        subnet_id_list (list of string): IDs of the candidate subnets
+        ip_address_str (string or int): IPv4 address to look for
+        verbose (boolean): print extra info; default is False
+
+    Returns:
+        subnet: the subnet containing the address, or None
+        subnets: dictionary of all candidate subnets keyed by SubnetId
+    """
     subnets = get_subnets(client, subnet_id_list, verbose=verbose)
-    ip_address = ipaddress.ip_address(ip_address_str)
-    for s in subnets:
-        cidr = ipaddress.ip_network(s['CidrBlock'])
-        if ip_address in cidr:
-            return s, subnets
-    return None, subnets
-
-def find_route_matches(routes, dest_ip_str, verbose=False):
-    dest_ip = ipaddress.ip_address(dest_ip_str)
-    match = {}
-    for r in routes:
-        if verbose:
-            print(f"Considering route: {r}")
-        if 'DestinationCidrBlock' not in r:
+    subnet_index = build_prefix_index(subnets.values(), 'CidrBlock')
+    match = find_longest_prefix_match(subnet_index, as_ipv4_int(ip_address_str))
+    if match is None:
+        return None, subnets
+    return match[1][0], subnets
+
+def build_prefix_index(entries, cidr_key):
+    """
+    Index entries by the IPv4 CIDR block they apply to
+
+    Each prefix length gets its own hash table keyed by network address, so
+    a lookup costs one dict probe per distinct prefix length in use rather
+    than one containment test per entry.
+
+    Parameters:
+        entries (list of dictionary): e.g., routes or NACL entries
+        cidr_key (string): key holding the CIDR block; entries without it are skipped
+
+    Returns:
+        dictionary: prefixlen -> (mask, {network: [entries]}), ordered from
+        the longest prefix to the shortest
+    """
+    index = {}
+    for e in entries:
+        if cidr_key not in e:
             continue
-        route_cidr = ipaddress.ip_network(r['DestinationCidrBlock'])
-        if dest_ip in route_cidr:
-            if route_cidr.prefixlen > match.get('prefixlen', -1):
-                match = { 'route': r, 'route_cidr': route_cidr, 'prefixlen': route_cidr.prefixlen }
-            if verbose:
-                print("Route matched. ")
-                print("Current best match:")
-                pprint(match)
-    return match.get('route', None)
-
-def find_nacl_rule_matches(nacl_entries, dest_ip_str):
-    inbound_rules = []
-    outbound_rules = []
-    dest_ip = ipaddress.ip_address(dest_ip_str)
-    for e in nacl_entries:
-        cidr = ipaddress.ip_network(e['CidrBlock'])
-        if dest_ip in cidr:
-            if e['Egress']:
-                outbound_rules.append(e)
-            else:
-                inbound_rules.append(e)
-    return inbound_rules, outbound_rules
+        network, mask, prefixlen = parse_ipv4_cidr(e[cidr_key])
+        _, networks = index.setdefault(prefixlen, (mask, {}))
+        networks.setdefault(network, []).append(e)
+    return dict(sorted(index.items(), reverse=True))
+
+def find_longest_prefix_match(index, ip_address):
+    """
+    Find the entries with the longest prefix covering an address
 
-def find_security_group_matches(permissions, dest_ip_str):
+    Parameters:
+        index (dictionary): index from build_prefix_index()
+        ip_address (int): IPv4 address
+
+    Returns:
+        tuple: (prefixlen, [entries]), or None if nothing covers the address
+    """
+    # prefix lengths are visited longest first, so the first hit is the best match
+    for prefixlen, (mask, networks) in index.items():
+        entries = networks.get(ip_address & mask)
+        if entries is not None:
+            return prefixlen, entries
+    return None
+
+def find_route_matches(routes, dest_ip_str, verbose=False, route_index=None):
+    dest_ip = as_ipv4_int(dest_ip_str)
+    if route_index is None:
+        route_index = build_prefix_index(routes, 'DestinationCidrBlock')
+    if verbose:
+        print(f"Considering routes: {routes}")
+    match = find_longest_prefix_match(route_index, dest_ip)
+    if match is None:
+        return None
+    prefixlen, candidates = match
+    r = candidates[0]
+    if verbose:
+        print("Route matched. ")
+        print("Best match:")
+        pretty_print({ 'route': r, 'route_cidr': r['DestinationCidrBlock'], 'prefixlen': prefixlen })
+    return r
+
+def find_nacl_rule_matches(nacl_entries, dest_ip_str, nacl_index=None):
+    dest_ip = as_ipv4_int(dest_ip_str)
+    if nacl_index is None:
+        nacl_index = build_prefix_index(nacl_entries, 'CidrBlock')
     matches = []
-    dest_ip = ipaddress.ip_address(dest_ip_str)
-    for p in permissions:
-        matched_p = None
-        if len(p['IpRanges']) > 0:
-            for r in p['IpRanges']:
-                if r['CidrIp'] == ALL_IPV4:
-                    matched_p = p
-                    break
-                cidr = ipaddress.ip_network(r['CidrIp'])
-                if dest_ip in cidr:
-                    matched_p = p
-                    break
+    # every prefix length may hold a covering entry, not just the longest
+    for mask, networks in nacl_index.values():
+        matches += networks.get(dest_ip & mask, [])
+    matches.sort(key=lambda e: e['RuleNumber'])
+    inbound_rules = [e for e in matches if not e['Egress']]
+    outbound_rules = [e for e in matches if e['Egress']]
+    return inbound_rules, outbound_rules
+
+def compile_security_group_permissions(permissions):
+    """
+    Flatten security group permissions into parallel arrays for matching
+
+    Parameters:
+        permissions (list of dictionary): IpPermissions or IpPermissionsEgress
+
+    Returns:
+        networks (array): network address of each IPv4 range
+        masks (array): netmask of each IPv4 range
+        indexes (array): index into permissions of the permission owning each range
+        always (set): indexes of permissions that match any destination
+    """
+    networks = array('I')
+    masks = array('I')
+    indexes = array('I')
+    always = set()
+    for i, p in enumerate(permissions):
+        # security group references match without looking at any CIDR
+        if len(p['UserIdGroupPairs']) > 0:
+            always.add(i)
+            continue
+        for r in p['IpRanges']:
+            network, mask, _ = parse_ipv4_cidr(r['CidrIp'])
+            # a zero mask (/0) matches every destination
+            if mask == 0:
+                always.add(i)
+                break
+            networks.append(network)
+            masks.append(mask)
+            indexes.append(i)
+    return networks, masks, indexes, always
+
+def find_security_group_matches(permissions, dest_ip_str, compiled=None):
+    dest_ip = as_ipv4_int(dest_ip_str)
+    if compiled is None:
+        compiled = compile_security_group_permissions(permissions)
+    networks, masks, indexes, always = compiled
+    matched = set(always)
+    for network, mask, i in zip(networks, masks, indexes):
+        if (dest_ip & mask) == network:
+            matched.add(i)
+
+    for i, p in enumerate(permissions):
+        if i in matched:
+            yield p
+            continue
         if len(p['Ipv6Ranges']) > 0:
             print("WARNING. Ignoring IPv6 rules in Security Group.")
         if len(p['PrefixListIds']) > 0:
             print("WARNING. Ignoring Perfix List rules in Security Group.")
-        if len(p['UserIdGroupPairs']) > 0:
-            matched_p = p
-        if matched_p is not None:
-            matches.append(matched_p)
-    return matches
 
 def get_nacls_for_subnets(client, list_subnet_ids, verbose=False):
-    response = client.describe_network_acls(
-        Filters=[
-            {
-                'Name': 'association.subnet-id',
-                'Values': list_subnet_ids
-            }
-        ]
-    )
-    if verbose:
-        pprint(response['NetworkAcls'])
-    return response['NetworkAcls']
+    # per-run memo on a CachingClient; a bare boto3 client gets a throwaway one
+    subnet_nacls = getattr(client, 'subnet_nacls', {})
+    if all(subnet_id in subnet_nacls for subnet_id in list_subnet_ids):
+        nacls = list({subnet_nacls[s]['NetworkAclId']: subnet_nacls[s] for s in list_subnet_ids}.values())
+    else:
+        response = client.describe_network_acls(
+            Filters=[
+                {
+                    'Name': 'association.subnet-id',
+                    'Values': list_subnet_ids
+                }
+            ]
+        )
+        nacls = response['NetworkAcls']
+        for nacl in nacls:
+            if '_Compiled' not in nacl:
+                nacl['_Compiled'] = build_prefix_index(nacl['Entries'], 'CidrBlock')
+            for a in nacl.get('Associations', []):
+                subnet_nacls[a['SubnetId']] = nacl
+    print_verbose(nacls, verbose)
+    return nacls
 
 def get_main_route_table_for_vpc(client, vpc_id):
     response = client.describe_route_tables(
@@ -142,30 +383,56 @@ def get_main_route_table_for_vpc(client, vpc_id):
     return response['RouteTables'][0]
 
 def get_route_tables_for_subnets(client, vpc_id, list_subnet_ids, verbose=False):
+    # per-run memo on a CachingClient; a bare boto3 client gets a throwaway one
+    subnet_rtables = getattr(client, 'subnet_route_tables', {})
+    if not all(subnet_id in subnet_rtables for subnet_id in list_subnet_ids):
+        response = client.describe_route_tables(
+            Filters=[
+                {
+                    'Name': 'association.subnet-id',
+                    'Values': list_subnet_ids
+                }
+            ]
+        )
+        for rt in response['RouteTables']:
+            for a in rt.get('Associations', []):
+                if 'SubnetId' in a:
+                    subnet_rtables[a['SubnetId']] = rt
+        # subnets without an explicit association use the VPC's main route table
+        if not all(subnet_id in subnet_rtables for subnet_id in list_subnet_ids):
+            main_rtable = get_main_route_table_for_vpc(client, vpc_id)
+            for subnet_id in list_subnet_ids:
+                subnet_rtables.setdefault(subnet_id, main_rtable)
+
     rtables = {}
     for subnet_id in list_subnet_ids:
-        result = get_route_table_for_subnet(client, vpc_id, subnet_id, verbose=verbose)
+        result = subnet_rtables[subnet_id]
+        if verbose:
+            print("Route Table for Subnet " + subnet_id + ":")
+            pretty_print(result)
         rtables[result['RouteTableId']] = result
     return rtables.values()
 
 def get_route_table_for_subnet(client, vpc_id, subnet_id, verbose=False):
-    response = client.describe_route_tables(
-        Filters=[
-            {
-                'Name': 'association.subnet-id',
-                'Values': [subnet_id]
-            }
-        ]
-    )
-    assert len(response['RouteTables']) <= 1
-    result = None
-    if len(response['RouteTables']) == 1:
-        result = response['RouteTables'][0]
-    else:
-        result = get_main_route_table_for_vpc(client, vpc_id)
+    subnet_rtables = getattr(client, 'subnet_route_tables', {})
+    if subnet_id not in subnet_rtables:
+        response = client.describe_route_tables(
+            Filters=[
+                {
+                    'Name': 'association.subnet-id',
+                    'Values': [subnet_id]
+                }
+            ]
+        )
+        assert len(response['RouteTables']) <= 1
+        if len(response['RouteTables']) == 1:
+            subnet_rtables[subnet_id] = response['RouteTables'][0]
+        else:
+            subnet_rtables[subnet_id] = get_main_route_table_for_vpc(client, vpc_id)
+    result = subnet_rtables[subnet_id]
     if verbose:
         print("Route Table for Subnet " + subnet_id + ":")
-        pprint(result)
+        pretty_print(result)
     return result
 
 def get_nat_gateway(client, nat_gateway_id):
@@ -288,7 +555,8 @@ def get_ec2_instance_by_private_ip(client, private_ip_address):
     assert len(response['Reservations']) == 1
     assert len(response['Reservations'][0]['Instances']) == 1
     source_instance = response['Reservations'][0]['Instances'][0]
-    source_instance['Name'] = get_value_for_tag_key(source_instance['Tags'], 'Name')
+    source_instance['_TagMap'] = get_tag_map(source_instance.get('Tags', []))
+    source_instance['Name'] = get_value_for_tag_key(source_instance['_TagMap'], 'Name')
     return source_instance
 
 def get_security_groups(client, sg_group_ids, dest_ip_address, verbose=False):
@@ -298,7 +566,7 @@ def get_security_groups(client, sg_group_ids, dest_ip_address, verbose=False):
     Parameters:
         client: boto3 EC2 client
         sg_group_ids (list of string): list of security group IDs
-        dest_ip_address (string): private or public ip address of the destination
+        dest_ip_address (string or int): private or public ip address of the destination
         verbose (boolean): print extra info; default is False
 
     Returns:
@@ -308,19 +576,27 @@ def get_security_groups(client, sg_group_ids, dest_ip_address, verbose=False):
     response = client.describe_security_groups(
         GroupIds=sg_group_ids
     )
-    assert len(response['SecurityGroups']) == len(sg_group_ids)
-    source_security_groups = response['SecurityGroups']
+    source_security_groups = {sg['GroupId']: sg for sg in response['SecurityGroups']}
+    assert set(sg_group_ids) == source_security_groups.keys()
 
-    if verbose:
-        pprint(source_security_groups)
-
-    ingress_sg_matches = []
-    egress_sg_matches = []
-    for security_group in source_security_groups:
-        temp = find_security_group_matches(security_group['IpPermissions'], dest_ip_address)
-        ingress_sg_matches += temp
-        temp = find_security_group_matches(security_group['IpPermissionsEgress'], dest_ip_address)
-        egress_sg_matches += temp
+    print_verbose(response['SecurityGroups'], verbose)
+
+    for security_group in source_security_groups.values():
+        # compile once per security group; cached responses carry it to later destinations
+        if '_Compiled' not in security_group:
+            security_group['_Compiled'] = (
+                compile_security_group_permissions(security_group['IpPermissions']),
+                compile_security_group_permissions(security_group['IpPermissionsEgress']),
+            )
+    dest_ip_address = as_ipv4_int(dest_ip_address)
+    ingress_sg_matches = list(chain.from_iterable(
+        find_security_group_matches(sg['IpPermissions'], dest_ip_address, compiled=sg['_Compiled'][0])
+        for sg in source_security_groups.values()
+    ))
+    egress_sg_matches = list(chain.from_iterable(
+        find_security_group_matches(sg['IpPermissionsEgress'], dest_ip_address, compiled=sg['_Compiled'][1])
+        for sg in source_security_groups.values()
+    ))
     return ingress_sg_matches, egress_sg_matches
 
 def get_rds_instance(client, source_rds_name, verbose=False):
@@ -391,22 +667,35 @@ def get_rds_instance(client, source_rds_name, verbose=False):
                                 'VpcSecurityGroupId': 'sg-b8348ec1'}]}
     """
     response = client.describe_db_instances(
-        DBInstanceIdentifier=source_rds_name
+        DBInstanceIdentifier=source_rds_name,
+        MaxRecords=20
     )
-    if verbose:
-        pprint(response)
+    print_verbose(response, verbose)
     assert len(response['DBInstances']) <= 1
     if  len(response['DBInstances']) == 0:
         return None
     return response['DBInstances'][0]
 
-def get_dc_virtual_interface(virtual_gateway_id, verbose=False):
+def resolve_hostname(hostname, cache=None):
+    """
+    Resolve a DNS name (e.g., an RDS endpoint) to an IPv4 address
+
+    Pass the same cache dictionary for the whole run to resolve each name only once.
+    """
+    if cache is None:
+        return socket.gethostbyname(hostname)
+    if hostname not in cache:
+        cache[hostname] = socket.gethostbyname(hostname)
+    return cache[hostname]
+
+def get_dc_virtual_interface(virtual_gateway_id, verbose=False, dc_client=None):
     """
     Find the virtual interface that belongs to the given gateway.
 
     Parameters:
         virtual_gateway_id (string): ID of the target virtual gateway
         verbose (boolean): print extra info; default is False
+        dc_client: boto3 Direct Connect client; a new one is created if not given
 
     Returns:
         list of dictionary of virtual interface properties
@@ -462,7 +751,8 @@ def get_dc_virtual_interface(virtual_gateway_id, verbose=False):
         },
     ]
     """
-    dc_client = boto3.client('directconnect')
+    if dc_client is None:
+        dc_client = make_client('directconnect')
     response = dc_client.describe_virtual_interfaces()
     results = []
     for i in response['virtualInterfaces']:
@@ -482,8 +772,7 @@ def report_dc_virtual_interfaces(dc_vifs, verbose=False):
         boolean: whether or not a network problem exists in from the perspective of the NACL
     """
     print("Checking Direct Connect Virtual Interfaces:")
-    if verbose:
-        pprint(dc_vifs)
+    print_verbose(dc_vifs, verbose)
     if not dc_vifs:
         print("NETWORK CONNECTIVITY ERROR. No DC Virtual Interfaces present.")
         return True
@@ -492,14 +781,14 @@ def report_dc_virtual_interfaces(dc_vifs, verbose=False):
         this_interface_problem = False
         if i['virtualInterfaceState'] != 'available':
             print("NETWORK CONNECTIVITY ERROR. DC Virtual Interface is not in 'available' state:")
-            pprint(i)
+            pretty_print(i)
             network_problem_exists = True
             this_interface_problem = True
 
         for bgp_peer in i['bgpPeers']:
             if bgp_peer['bgpStatus'] != 'up' or bgp_peer['bgpPeerState'] != 'available':
                 print("NETWORK CONNECTIVITY ERROR. DC Virtual Interface BGP Peer issue:")
-                pprint(bgp_peer)
+                pretty_print(bgp_peer)
                 network_problem_exists = True
                 this_interface_problem = True
             else:
@@ -527,14 +816,15 @@ def report_nacl(source_nacl, source_ip_address, dest_ip_address, verbose=False):
     print("============================================================")
     print("Network ACL analysis")
     print("NACL entries applied on source IP " + source_ip_address + " relevant to destination IP " + dest_ip_address)
-    inbound_rules, outbound_rules = find_nacl_rule_matches(source_nacl['Entries'], dest_ip_address)
+    dest_ip = ipv4_to_int(dest_ip_address)
+    inbound_rules, outbound_rules = find_nacl_rule_matches(source_nacl['Entries'], dest_ip, nacl_index=source_nacl.get('_Compiled'))
     print("Inbound Rules:")
-    pprint(inbound_rules)
+    pretty_print(inbound_rules)
     if len(inbound_rules) == 0:
         print("NETWORK CONNECTIVITY ERROR. No relevant inbound rules for NACL.")
         network_problem_exists = True
     print("Outbound Rules:")
-    pprint(outbound_rules)
+    pretty_print(outbound_rules)
     if len(outbound_rules) == 0:
         print("NETWORK CONNECTIVITY ERROR. No relevant outbound rules for NACL.")
         network_problem_exists = True
@@ -545,13 +835,15 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
     print("============================================================")
     print("Analysis of Route Table applied on source IP " + source_ip_address + " relevant to destination IP " + dest_ip_address)
     print("Route Table in use for source: " + source_route_table['RouteTableId'])
-    if verbose:
-        pprint(source_route_table)
+    print_verbose(source_route_table, verbose)
     print("Finding route to " + dest_ip_address)
-    r = find_route_matches(source_route_table['Routes'], dest_ip_address, verbose)
+    if '_RouteIndex' not in source_route_table:
+        source_route_table['_RouteIndex'] = build_prefix_index(source_route_table['Routes'], 'DestinationCidrBlock')
+    dest_ip = ipv4_to_int(dest_ip_address)
+    r = find_route_matches(source_route_table['Routes'], dest_ip, verbose, route_index=source_route_table['_RouteIndex'])
     if r is not None:
         print("Matching route:")
-        pprint(r)
+        pretty_print(r)
 
     if r is None:
         print("NETWORK CONNECTIVITY ERROR. There is no route to " + dest_ip_address)
@@ -567,7 +859,7 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
             )
             assert len(response['InternetGateways']) == 1
             source_gateway = response['InternetGateways'][0]
-            pprint(source_gateway)
+            pretty_print(source_gateway)
             assert len(source_gateway['Attachments']) == 1
             if source_gateway['Attachments'][0]['State'] != "available":
                 print("NETWORK CONNECTIVITY ERROR. Internet Gateway is NOT attached.")
@@ -581,7 +873,7 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
             )
             assert len(response['VpnGateways']) == 1
             source_gateway = response['VpnGateways'][0]
-            pprint(source_gateway)
+            pretty_print(source_gateway)
             assert len(source_gateway['VpcAttachments']) == 1
             if source_gateway['State'] != 'available':
                 print("NETWORK CONNECTIVITY ERROR. Virtual Gateway is NOT available.")
@@ -601,8 +893,7 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
         # NAT
         print("Via NAT: " + r['NatGatewayId'])
         nat_gateway = get_nat_gateway(ec2_client, r['NatGatewayId'])
-        if verbose:
-            pprint(nat_gateway)
+        print_verbose(nat_gateway, verbose)
         print("NAT Gateway state: " + nat_gateway['State'])
         if nat_gateway['State'] != 'available':
             print("NETWORK CONNECTIVITY ERROR. NAT Gateway not available")
@@ -613,8 +904,7 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
         print("Via peering connection: " + r['VpcPeeringConnectionId'])
 
         vpc_peering_connection = get_vpc_peering_connections(ec2_client, r['VpcPeeringConnectionId'])
-        if verbose:
-            pprint(vpc_peering_connection)
+        print_verbose(vpc_peering_connection, verbose)
         print("VPC Peering Connection status: " + vpc_peering_connection['Status']['Code'])
         if vpc_peering_connection['Status']['Code'] != 'active':
             print("NETWORK CONNECTIVITY ERROR. VPC Peering Connection is not active")
@@ -626,30 +916,31 @@ def report_route_table(ec2_client, source_route_table, source_vpc_id, source_ip_
         else:
             destination_peering_info = vpc_peering_connection['AccepterVpcInfo']
         print("Destination peering info:")
-        pprint(destination_peering_info)
+        pretty_print(destination_peering_info)
 
     else:
         print("ERROR. Unknown route type:")
-        pprint(r)
+        pretty_print(r)
         network_problem_exists = True
 
     return network_problem_exists
 
 def report_security_groups(ec2_client, source_security_group_ids, source_ip_address, dest_ip_address, verbose=False):
     network_problem_exists = False
-    ingress_sg_matches, egress_sg_matches = get_security_groups(ec2_client, source_security_group_ids, dest_ip_address, verbose=verbose)
+    dest_ip = ipv4_to_int(dest_ip_address)
+    ingress_sg_matches, egress_sg_matches = get_security_groups(ec2_client, source_security_group_ids, dest_ip, verbose=verbose)
 
     print("============================================================")
     print("Analysis of Security Group ingress/egress applied on source IP " + source_ip_address + " to/from destination IP " + dest_ip_address)
     print("Potential Ingress Matches")
-    pprint(ingress_sg_matches)
+    pretty_print(ingress_sg_matches)
     if len(ingress_sg_matches) == 0:
         network_problem_exists = True
         print("NETWORK CONNECTIVITY ERROR. No ingress is allowed by source Security Groups for " + dest_ip_address)
         print("\tPerhaps access to this AWS resource is indirect, through a loadbalancer? ")
 
     print("Potential Egress Matches:")
-    pprint(egress_sg_matches)
+    pretty_print(egress_sg_matches)
     if len(egress_sg_matches) == 0:
         network_problem_exists = True
         print("NETWORK CONNECTIVITY ERROR. No egress is allowed by source Security Groups for " + dest_ip_address)
@@ -739,24 +1030,39 @@ def get_dms_instance(client, source_dms_name, verbose=False):
                 'Name': 'replication-instance-id',
                 'Values': [source_dms_name]
             }
-        ]
+        ],
+        MaxRecords=20
     )
-    if verbose:
-        pprint(response['ReplicationInstances'])
+    print_verbose(response['ReplicationInstances'], verbose)
     assert len(response['ReplicationInstances']) <= 1
     if  len(response['ReplicationInstances']) == 0:
         return None
     return response['ReplicationInstances'][0]
 
-def main(argv):
-
-    parser = parser = argparse.ArgumentParser(description='show network connectivity between two IPs')
+def ipv4_address_arg(value):
+    """
+    argparse type for IPv4 address arguments; rejects bad input before any AWS calls
+    """
+    try:
+        ipv4_to_int(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='show network connectivity between two IPs')
     parser.add_argument('-v', '--verbose', default=False, action='store_true', help="show more info")
     parser.add_argument('-s', '--source-ec2-ip', required=False, default='', help="private IP address of source in AWS")
-    parser.add_argument('-d', '--dest-ip', required=True, help="destination IP address")
+    parser.add_argument('-d', '--dest-ip', required=True, type=ipv4_address_arg, help="destination IP address")
     parser.add_argument('-r', '--source-rds', required=False, default='', help="name of RDS instance for source")
     parser.add_argument('-m', '--source-dms', required=False, default='', help="name of DMS instance for source")
-    args = parser.parse_args()
+    return parser
+
+ARG_PARSER = build_arg_parser()
+
+def main(argv):
+
+    args = ARG_PARSER.parse_args(argv)
 
     verbose = args.verbose
     source_ec2_ip_address = args.source_ec2_ip
@@ -765,18 +1071,19 @@ def main(argv):
     source_dms_name = args.source_dms
     source_security_group_ids = []
 
-    print("============================================================")
-    print("Input parameters:")
-    print("verbose: " + str(verbose))
-    print("source_ec2_ip_address: " + source_ec2_ip_address)
-    print("dest_ip_address: " + dest_ip_address)
-    print("source_rds_name: " + source_rds_name)
-    print("source_dms_name: " + source_dms_name)
+    print("\n".join([
+        "============================================================",
+        "Input parameters:",
+        f"verbose: {verbose}",
+        f"source_ec2_ip_address: {source_ec2_ip_address}",
+        f"dest_ip_address: {dest_ip_address}",
+        f"source_rds_name: {source_rds_name}",
+        f"source_dms_name: {source_dms_name}",
+    ]))
 
     network_problem_exists = False
-    ec2_client = boto3.client('ec2')
-    rds_client = boto3.client('rds')
-    dms_client = boto3.client('dms')
+    ec2_client = make_client('ec2')
+    dns_cache = {}
 
     print("============================================================")
     print("Source info:")
@@ -787,38 +1094,37 @@ def main(argv):
             print("ERROR. Source EC2 instance with private IP address " + source_ec2_ip_address + " cannot be found.")
         else:
             # EC2
-            pprint(source_instance)
             source_vpc_id = source_instance['VpcId']
             source_subnet_id = source_instance['SubnetId']
             source_name = source_instance['Name']
             source_dns_name = source_instance['PrivateDnsName']
             source_ip_address = source_instance['PrivateIpAddress']
-            assert source_ec2_ip_address == source_ip_address
+            if source_ec2_ip_address != source_ip_address:
+                raise RuntimeError(f"EC2 instance private IP {source_ip_address} does not match requested {source_ec2_ip_address}")
 
             source_security_groups = source_instance['SecurityGroups']
-            for sg in source_security_groups:
-                source_security_group_ids.append(sg['GroupId'])
+            source_security_group_ids = [sg['GroupId'] for sg in source_security_groups]
 
-            if verbose:
-                pprint(source_instance)
+            print_verbose(source_instance, verbose)
             print("InstanceId: " + source_instance['InstanceId'])
 
     if source_rds_name != '':
+        rds_client = make_client('rds')
         source_rds_instance = get_rds_instance(rds_client, source_rds_name, verbose=verbose)
         if source_rds_instance is None:
             print("ERROR. Source RDS instance with name " + source_rds_name + " cannot be found.")
         else:
             # RDS
-            pprint(source_rds_instance)
             source_name = source_rds_instance['DBInstanceIdentifier']
             source_vpc_id = source_rds_instance['DBSubnetGroup']['VpcId']
             source_dns_name = source_rds_instance['Endpoint']['Address']
-            source_ip_address = socket.gethostbyname(source_dns_name)
+            source_ip_address = resolve_hostname(source_dns_name, cache=dns_cache)
 
             subnet_id_list = process_subnet_list(source_rds_instance['DBSubnetGroup']['Subnets'])
 
             source_subnet, all_subnets = find_subnet_for_ip(ec2_client, subnet_id_list, source_ip_address, verbose=verbose)
-            assert source_subnet is not None
+            if source_subnet is None:
+                raise RuntimeError(f"no subnet in {subnet_id_list} contains {source_ip_address}")
             source_subnet_id = source_subnet['SubnetId']
 
             # validate that DBSubnet Group subnets use the same RouteTable
@@ -826,22 +1132,19 @@ def main(argv):
             network_problem_exists = network_problem_exists or problem
 
             source_security_groups = source_rds_instance['VpcSecurityGroups']
-            for sg in source_security_groups:
-                source_security_group_ids.append(sg['VpcSecurityGroupId'])
+            source_security_group_ids = [sg['VpcSecurityGroupId'] for sg in source_security_groups]
 
             print("RDS Instance PubliclyAccessible: " + str(source_rds_instance['PubliclyAccessible']))
-            if verbose:
-                pprint(source_rds_instance)
-            if source_rds_instance['PubliclyAccessible'] and dest_ip_address.starts_with("10."):
+            if source_rds_instance['PubliclyAccessible'] and is_private_ipv4(dest_ip_address):
                 print("WARNING. Destination IP is private, but RDS instance is Public! Results of this analsysi may be incorrect!")
 
     if source_dms_name != '':
+        dms_client = make_client('dms')
         source_dms_instance = get_dms_instance(dms_client, source_dms_name, verbose=verbose)
         if source_dms_instance is None:
             print("ERROR. Source DMS instance with name " + source_dms_name + " cannot be found.")
         else:
             # DMS
-            pprint(source_dms_instance)
             source_name = source_dms_instance['ReplicationInstanceIdentifier']
             source_vpc_id = source_dms_instance['ReplicationSubnetGroup']['VpcId']
             source_ip_address = source_dms_instance['ReplicationInstancePrivateIpAddress']
@@ -849,7 +1152,8 @@ def main(argv):
 
             subnet_id_list = process_subnet_list(source_dms_instance['ReplicationSubnetGroup']['Subnets'])
             source_subnet, all_subnets = find_subnet_for_ip(ec2_client, subnet_id_list, source_ip_address, verbose=verbose)
-            assert source_subnet is not None
+            if source_subnet is None:
+                raise RuntimeError(f"no subnet in {subnet_id_list} contains {source_ip_address}")
             source_subnet_id = source_subnet['SubnetId']
 
             # validate that Subnet Group subnets use the same RouteTable
@@ -857,19 +1161,32 @@ def main(argv):
             network_problem_exists = network_problem_exists or problem
 
             source_security_groups = source_dms_instance['VpcSecurityGroups']
-            for sg in source_security_groups:
-                source_security_group_ids.append(sg['VpcSecurityGroupId'])
+            source_security_group_ids = [sg['VpcSecurityGroupId'] for sg in source_security_groups]
 
     # EC2 + RDS + DMS common values
-    print("Source IP Address: " + source_ip_address)
-    print("Name: " + source_name)
-    print("DNS Name:" + source_dns_name)
-    print("SubnetId: " + source_subnet_id)
-    print("VpcId: " + source_vpc_id)
+    print("\n".join([
+        f"Source IP Address: {source_ip_address}",
+        f"Name: {source_name}",
+        f"DNS Name:{source_dns_name}",
+        f"SubnetId: {source_subnet_id}",
+        f"VpcId: {source_vpc_id}",
+    ]))
+
+    # The security group, route table and NACL lookups are independent, so
+    # fetch them concurrently; the reports below are then served from the
+    # caching client in their usual order.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(ec2_client.describe_security_groups, GroupIds=source_security_group_ids),
+            executor.submit(get_route_table_for_subnet, ec2_client, source_vpc_id, source_subnet_id),
+            executor.submit(get_nacls_for_subnets, ec2_client, [source_subnet_id]),
+        ]
+        for f in futures:
+            f.result()
 
     # SECURITY GROUPS
     print("Security Groups: ")
-    pprint(source_security_groups)
+    pretty_print(source_security_groups)
     problem = report_security_groups(ec2_client, source_security_group_ids, source_ip_address, dest_ip_address, verbose=verbose)
     network_problem_exists = network_problem_exists or problem
 
@@ -880,10 +1197,10 @@ def main(argv):
 
     # NACL
     result = get_nacls_for_subnets(ec2_client, [source_subnet_id], verbose=verbose)
-    assert len(result) == 1
+    if len(result) != 1:
+        raise RuntimeError(f"expected 1 NACL for subnet {source_subnet_id}, found {len(result)}")
     source_nacl = result[0]
-    if verbose:
-        pprint(source_nacl)
+    print_verbose(source_nacl, verbose)
     problem = report_nacl(source_nacl, source_ip_address, dest_ip_address, verbose)
     network_problem_exists = network_problem_exists or problem
 